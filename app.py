@@ -4,10 +4,38 @@ Secure, privacy-focused document search and analysis tool.
 """
 
 import streamlit as st
-import tempfile
+import hashlib
 import os
 import re
-from typing import List, Dict, Tuple, Optional
+import multiprocessing
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+from heapq import heappop, heappush
+from itertools import islice
+from io import StringIO
+from typing import List, Dict, Tuple, Optional, Iterator
+
+# PDF support lives in its own module so worker processes can import it
+from pdf_text import pypdf, read_pdf_text, submit_pdf_texts
+
+try:
+    import pandas as pd  # optional: charts in the Analytics tab
+except ImportError:
+    pd = None
+
+try:
+    import ahocorasick  # optional: pip install pyahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:
+    import hyperscan  # optional: pip install hyperscan
+except ImportError:
+    hyperscan = None
 
 # Configure page
 st.set_page_config(
@@ -42,21 +70,30 @@ st.markdown("""
 st.title("🔍 AI Document Search Pro - Local RAG System")
 st.markdown("**Transform static documents into interactive, queryable knowledge - 100% local, no API keys, complete privacy.**")
 
+# Matches kept per file; the results view shows the first 100 of them
+MAX_MATCHES_PER_FILE = 500
+# Longest search query accepted
+MAX_QUERY_LENGTH = 1000
+
+# Word tokens for frequency analytics
+_TOKEN_RE = re.compile(r"\b[\w'-]+\b")
+
 # Security: Validate file names
+_UNSAFE_CHARS = re.compile(r'[^\w\-.]')
+
 def sanitize_filename(filename: str) -> str:
     """Remove potentially dangerous characters from filename."""
-    filename = os.path.basename(filename)
-    safe_name = re.sub(r'[^\w\-\.]', '_', filename)
-    return safe_name[:255]
+    return _UNSAFE_CHARS.sub('_', os.path.basename(filename))[:255]
 
 # Security: Validate file content
 def validate_file_content(content: bytes, filename: str) -> Tuple[bool, str]:
     """Basic security validation of uploaded files."""
     MAX_SIZE = 50 * 1024 * 1024  # 50MB
-    if len(content) > MAX_SIZE:
-        return False, f"File too large ({len(content)/1024/1024:.1f}MB > 50MB)"
+    size = len(content)
+    if size > MAX_SIZE:
+        return False, f"File too large ({size/1024/1024:.1f}MB > 50MB)"
     
-    if b'\x00' in content[:1024]:
+    if content.find(b'\x00', 0, 1024) != -1:
         return False, "File contains null bytes (potential security risk)"
     
     return True, "OK"
@@ -65,9 +102,11 @@ def validate_file_content(content: bytes, filename: str) -> Tuple[bool, str]:
 if "documents" not in st.session_state:
     st.session_state.documents = {}
 if "search_history" not in st.session_state:
-    st.session_state.search_history = []
+    st.session_state.search_history = OrderedDict()  # query -> None, most recent last
 if "search_results" not in st.session_state:
     st.session_state.search_results = []
+if "search_key" not in st.session_state:
+    st.session_state.search_key = ()
 if "total_matches" not in st.session_state:
     st.session_state.total_matches = 0
 
@@ -85,6 +124,11 @@ with st.sidebar:
     st.markdown("### Search Options")
     case_sensitive = st.checkbox("Case sensitive", value=False)
     whole_word = st.checkbox("Whole word only", value=False)
+    count_all = st.checkbox(
+        "Count all matches",
+        value=False,
+        help=f"Keep counting past the first {MAX_MATCHES_PER_FILE} matches per file (slower on very frequent terms)."
+    )
     show_context = st.checkbox("Show context", value=True)
     
     if show_context:
@@ -108,32 +152,124 @@ with st.sidebar:
     if st.button("🗑️ Clear All Data", type="secondary"):
         if st.checkbox("Confirm deletion", key="confirm_delete"):
             st.session_state.documents = {}
-            st.session_state.search_history = []
+            st.session_state.search_history = OrderedDict()
             st.session_state.search_results = []
+            st.session_state.search_key = ()
             st.session_state.total_matches = 0
             st.rerun()
 
-# PDF Processing
-def setup_pdf_support():
-    """Safely set up PDF support with error handling."""
+# ASCII separators that re's \s matches but Hyperscan's does not
+_RE_ONLY_SPACE_RE = re.compile(r'[\x1c-\x1f]')
+
+# Newline offsets for line-number lookups
+def _newline_positions(content: str) -> List[int]:
+    """Return the offset of every newline character in content."""
+    positions = []
+    pos = content.find('\n')
+    while pos != -1:
+        positions.append(pos)
+        pos = content.find('\n', pos + 1)
+    return positions
+
+# Extracted PDF text by SHA-1 of the file, shared by all sessions
+PDF_TEXT_CACHE_SIZE = 64
+
+@st.cache_resource(show_spinner=False)
+def _pdf_text_cache() -> Tuple["OrderedDict[str, str]", threading.Lock]:
+    """Return the process-wide LRU of extracted PDF text and the lock guarding it."""
+    return OrderedDict(), threading.Lock()
+
+def _cached_pdf_text(digest: str) -> Optional[str]:
+    """Return the text extracted earlier from a PDF with this digest, if any."""
+    cache, lock = _pdf_text_cache()
+    with lock:
+        text = cache.get(digest)
+        if text is not None:
+            cache.move_to_end(digest)
+        return text
+
+def _extract_pdf_text(file_content: bytes, digest: str, pending: Optional[Future] = None) -> str:
+    """Extract the text of a PDF, reusing earlier extractions of the same content.
+    
+    pending is a worker task already extracting this file.
+    """
+    text = _cached_pdf_text(digest)
+    if text is None:
+        text = pending.result() if pending is not None else read_pdf_text(file_content)
+        cache, lock = _pdf_text_cache()
+        with lock:
+            cache[digest] = text
+            while len(cache) > PDF_TEXT_CACHE_SIZE:
+                cache.popitem(last=False)
+    return text
+
+# Text files: decoding is cheaper than hashing the bytes for a cache lookup
+def _decode_text(file_content: bytes) -> str:
+    """Decode a text file as UTF-8, falling back to Latin-1."""
     try:
-        import pypdf
-        return pypdf, True
-    except ImportError:
-        try:
-            import PyPDF2 as pypdf
-            return pypdf, True
-        except ImportError:
-            return None, False
+        return file_content.decode('utf-8')
+    except UnicodeDecodeError:
+        return file_content.decode('latin-1', errors='ignore')
+
+def _build_document(
+    file_content: bytes,
+    is_pdf: bool,
+    digest: str,
+    pending: Optional[Future] = None
+) -> Optional[Dict]:
+    """Extract text and statistics from validated file bytes.
+    
+    digest is the SHA-1 of file_content; pending is a worker task
+    already extracting the file's PDF text.
+    """
+    if is_pdf:
+        content = _extract_pdf_text(file_content, digest, pending)
+        file_type = "pdf"
+    else:
+        content = _decode_text(file_content)
+        file_type = "txt"
+    
+    if not content.strip():
+        return None
+    
+    # Structures reused by search, analytics and the viewer on every rerun
+    lines_list = content.split('\n')
+    content_lower = content.lower()
+    return {
+        'content': content,
+        'type': file_type,
+        'size': len(content),
+        'words': len(content.split()),
+        'lines': len(lines_list),
+        'lines_list': lines_list,
+        'nl_positions': array('i', _newline_positions(content)),
+        'content_lower': content_lower,
+        # ASCII text as bytes for the Hyperscan prefilter, only when it is installed
+        'content_bytes': (
+            content.encode('ascii')
+            if hyperscan is not None and content.isascii() and not _RE_ONLY_SPACE_RE.search(content)
+            else None
+        ),
+        'token_counter': Counter(_TOKEN_RE.findall(content_lower)),
+        'sha1': digest
+    }
 
 # Safe document processing
-def process_uploaded_file(file) -> Optional[Dict]:
-    """Safely process an uploaded file with security checks."""
+def process_uploaded_file(
+    filename: str,
+    file_content: bytes,
+    digest: str,
+    validation: Tuple[bool, str],
+    pending: Optional[Future] = None
+) -> Optional[Dict]:
+    """Safely process an uploaded file with security checks.
+    
+    filename is already sanitized, digest is the SHA-1 of file_content and
+    validation is validate_file_content's result for it; pending is a worker
+    task already extracting the file's PDF text.
+    """
     try:
-        filename = sanitize_filename(file.name)
-        file_content = file.getvalue()
-        
-        is_valid, message = validate_file_content(file_content, filename)
+        is_valid, message = validation
         if not is_valid:
             st.error(f"Security check failed for {filename}: {message}")
             return None
@@ -141,140 +277,406 @@ def process_uploaded_file(file) -> Optional[Dict]:
         is_pdf = filename.lower().endswith('.pdf')
         
         if is_pdf:
-            pypdf_module, can_read_pdf = setup_pdf_support()
-            if not can_read_pdf:
+            if pypdf is None:
                 st.warning(f"PDF support not installed for {filename}. Install: pip install pypdf")
                 return None
-            
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
-                tmp.write(file_content)
-                tmp_path = tmp.name
-            
-            try:
-                pdf_reader = pypdf_module.PdfReader(tmp_path)
-                content = ""
-                for page in pdf_reader.pages:
-                    text = page.extract_text()
-                    if text:
-                        content += text + "\n\n"
-            finally:
-                try:
-                    os.unlink(tmp_path)
-                except:
-                    pass
-            file_type = "pdf"
-        else:
-            try:
-                content = file_content.decode('utf-8')
-            except UnicodeDecodeError:
-                content = file_content.decode('latin-1', errors='ignore')
-            file_type = "txt"
         
-        if content.strip():
-            return {
-                'content': content,
-                'type': file_type,
-                'size': len(content),
-                'words': len(content.split()),
-                'lines': len(content.split('\n'))
-            }
-        else:
+        result = _build_document(file_content, is_pdf, digest, pending)
+        if result is None:
             st.warning(f"Empty or unreadable file: {filename}")
-            return None
+        return result
             
     except Exception as e:
         st.error(f"Error processing file: {type(e).__name__}")
         return None
 
-# Enhanced search function
+# Compiled search patterns, shared across files and searches
+@lru_cache(maxsize=128)
+def _get_pattern(query: str, case_sensitive: bool, whole_word: bool, use_regex: bool = False) -> "re.Pattern":
+    """Compile and memoize the search pattern for a query and its options."""
+    pattern = query if use_regex else re.escape(query)
+    if whole_word:
+        pattern = r'(?<!\w)(?:' + pattern + r')(?!\w)'
+    return re.compile(pattern, 0 if case_sensitive else re.IGNORECASE)
+
+# Multi-keyword search: one Aho-Corasick pass finds every term
+@lru_cache(maxsize=32)
+def _get_automaton(terms: Tuple[str, ...]):
+    """Build and memoize an Aho-Corasick automaton over the given terms."""
+    automaton = ahocorasick.Automaton()
+    for term in terms:
+        automaton.add_word(term, len(term))
+    automaton.make_automaton()
+    return automaton
+
+def _is_word_char(char: str) -> bool:
+    """Tell whether char is a word character for the whole-word check."""
+    return char.isalnum() or char == '_'
+
+def _scan_keywords(haystack: str, content: str, automaton, whole_word: bool) -> Iterator[Tuple[int, int]]:
+    """Yield the (start, end) spans the longest-first keyword alternation would match.
+    
+    haystack is content itself or a same-length lower-cased copy of it.
+    Every overlapping hit is considered; at each position the longest
+    keyword that passes the whole-word check wins, as in the regex.
+    """
+    longest = automaton.get_stats()['longest_word']
+    candidates = []  # heap of (start, -length)
+    last_end = 0
+    
+    def settle(limit: int) -> Iterator[Tuple[int, int]]:
+        """Pick spans among the candidates that start before limit."""
+        nonlocal last_end
+        while candidates and candidates[0][0] < limit:
+            start, negative_length = heappop(candidates)
+            end = start - negative_length
+            if start < last_end:
+                continue
+            if whole_word and (
+                (start > 0 and _is_word_char(content[start-1])) or
+                (end < len(content) and _is_word_char(content[end]))
+            ):
+                continue
+            last_end = end
+            yield start, end
+    
+    for last, length in automaton.iter(haystack):
+        heappush(candidates, (last - length + 1, -length))
+        # Hits still to come end at or after last, so start no earlier than this
+        yield from settle(last - longest + 1)
+    yield from settle(len(haystack))
+
+# Plain substring search: str.find beats the regex engine on literals
+def _scan_literal(haystack: str, needle: str) -> Iterator[Tuple[int, int]]:
+    """Yield non-overlapping (start, end) spans of needle in haystack."""
+    size = len(needle)
+    pos = haystack.find(needle)
+    while pos != -1:
+        yield pos, pos + size
+        pos = haystack.find(needle, pos + size)
+
+# Regex search: the fallback for every mode the faster scanners cannot take
+def _scan_regex(content: str, compiled: "re.Pattern") -> Iterator[Tuple[int, int]]:
+    """Yield (start, end) spans of the compiled pattern's matches in content."""
+    for match in compiled.finditer(content):
+        yield match.span()
+
+# Regex mode: Hyperscan cheaply rules out documents without any match
+@lru_cache(maxsize=32)
+def _get_hyperscan_db(pattern: str, case_sensitive: bool):
+    """Compile and memoize a Hyperscan database, or None where it could disagree with re.
+    
+    Only ASCII patterns qualify: re folds case across Unicode (the Kelvin
+    sign matches k), Hyperscan does not. Documents it may scan are ASCII
+    without the separators matched by _RE_ONLY_SPACE_RE.
+    """
+    if not pattern.isascii():
+        return None
+    # re reads {,n} as {0,n}, [[:alpha:]] as a plain set and \N{...}, \u, \U
+    # as characters; Hyperscan reads them differently
+    if any(token in pattern for token in ('{,', '[:', '\\N', '\\u', '\\U')):
+        return None
+    flags = hyperscan.HS_FLAG_SINGLEMATCH
+    if not case_sensitive:
+        flags |= hyperscan.HS_FLAG_CASELESS
+    db = hyperscan.Database()
+    try:
+        db.compile(expressions=[pattern.encode('utf-8')], flags=[flags])
+    except hyperscan.error:
+        # Backreferences, lookaround, empty matches, ...
+        return None
+    return db
+
+def _hyperscan_matches(data: bytes, db) -> bool:
+    """Tell whether the database's pattern matches anywhere in data, stopping at the first hit."""
+    try:
+        db.scan(
+            data,
+            match_event_handler=lambda _id, _start, _end, _flags, _ctx: True,
+            scratch=hyperscan.Scratch(db)
+        )
+    except hyperscan.ScanTerminated:
+        return True
+    return False
+
+# Match contexts are shown as markdown: document text must not format itself
+_MD_SPECIAL_RE = re.compile(r'([!-/:-@\[-`{-~])')  # ASCII punctuation
+# A blank line would start a new block, and an indented one a code block
+_MD_BLANK_LINES_RE = re.compile(r'\n(?:[^\S\n]*\n)+')
+
+def _escape_markdown(text: str) -> str:
+    """Backslash-escape every character markdown could treat as syntax."""
+    return _MD_SPECIAL_RE.sub(r'\\\1', text)
+
+def _context_markdown(match: Dict) -> str:
+    """Render a match's context as a single markdown paragraph with the match in bold."""
+    context = match['context']
+    start = match['match_in_context']
+    if start is None:
+        rendered = _escape_markdown(context)
+    else:
+        end = start + match['match_length']
+        rendered = (
+            f"{_escape_markdown(context[:start])}"
+            f"**{_escape_markdown(context[start:end])}**"
+            f"{_escape_markdown(context[end:])}"
+        )
+    return _MD_BLANK_LINES_RE.sub('\n', rendered)
+
+# Per-file match collection
+def _search_one_file(
+    filename: str,
+    doc: Dict,
+    spans: Iterator[Tuple[int, int]],
+    show_context: bool,
+    context_chars: int,
+    count_all: bool
+) -> Optional[Dict]:
+    """Collect the matches of one document from its spans, or None if it has none."""
+    content = doc['content']
+    
+    nl_positions = doc['nl_positions']
+    lines = doc['lines_list']
+    file_matches = []
+    truncated = False
+    for match_start, match_end in spans:
+        if len(file_matches) >= MAX_MATCHES_PER_FILE:
+            truncated = True
+            break
+        
+        exact_match = content[match_start:match_end]
+        
+        if show_context:
+            context_start = max(0, match_start - context_chars)
+            context_end = min(len(content), match_end + context_chars)
+            context = content[context_start:context_end]
+            match_in_context = match_start - context_start
+        else:
+            context = exact_match
+            match_in_context = None
+        
+        line_num = bisect_left(nl_positions, match_start) + 1
+        line_text = lines[line_num-1]
+        
+        file_matches.append({
+            'position': match_start,
+            'line': line_num,
+            'line_text': line_text,
+            'exact_match': exact_match,
+            'context': context,
+            'match_in_context': match_in_context,
+            'match_length': len(exact_match)
+        })
+    
+    if not file_matches:
+        return None
+    
+    # The overflow match that stopped the loop, plus whatever is left
+    match_count = len(file_matches)
+    if truncated and count_all:
+        match_count += 1 + sum(1 for _ in spans)
+    
+    return {
+        'filename': filename,
+        'file_type': doc['type'],
+        'matches': file_matches,
+        'match_count': match_count,
+        'truncated': truncated
+    }
+
+# A '+' marks counts that stopped at MAX_MATCHES_PER_FILE
+def _is_uncounted(result: Dict) -> bool:
+    """Whether a file's match count stopped at the matches it keeps."""
+    return result['truncated'] and result['match_count'] == len(result['matches'])
+
+# Fingerprint of a set of documents, for keying cached results
+def _corpus_key(documents: Dict[str, Dict]) -> Tuple[Tuple[str, int], ...]:
+    """Cheap fingerprint of the given documents (name and content hash)."""
+    return tuple(sorted((name, hash(doc['content'])) for name, doc in documents.items()))
+
+# Whole-word lookups: word -> start offsets, per document
+_WORD_RE = re.compile(r'\w+')
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def _word_postings(content_hash: int, _content: str) -> Dict[str, array]:
+    """Index every maximal word run of a document by its lower-cased text.
+    
+    content_hash is hash(_content); only it is hashed by the cache, so
+    each document is indexed once no matter which corpus it is in.
+    """
+    postings = {}
+    for match in _WORD_RE.finditer(_content):
+        postings.setdefault(match.group().lower(), []).append(match.start())
+    return {word: array('i', starts) for word, starts in postings.items()}
+
+# Enhanced search function, cached per query, options and corpus
+@st.cache_data(max_entries=128, ttl="30m", show_spinner=False)
 def perform_search_enhanced(
     search_query: str,
-    search_in: List[str],
+    corpus_key: Tuple,
+    _documents: Dict[str, Dict],
     case_sensitive: bool,
     whole_word: bool,
     show_context: bool,
-    context_chars: int
+    context_chars: int,
+    use_regex: bool = False,
+    count_all: bool = False
 ) -> Tuple[List[Dict], int, str]:
-    """Perform secure text search across documents."""
-    if len(search_query) > 1000:
-        return [], 0, "Search query too long (max 1000 characters)"
+    """Perform secure text search across documents.
+    
+    _documents are the documents to search and corpus_key their
+    _corpus_key(); only the key is hashed by the cache.
+    Without regex mode, terms separated by ``|`` are searched together.
+    At most MAX_MATCHES_PER_FILE matches are kept per file; with count_all
+    the remaining matches are still counted.
+    """
+    if len(search_query) > MAX_QUERY_LENGTH:
+        return [], 0, f"Search query too long (max {MAX_QUERY_LENGTH} characters)"
     
     all_results = []
     total_matches = 0
     
-    for filename in search_in:
-        if filename not in st.session_state.documents:
-            continue
-            
-        doc = st.session_state.documents[filename]
+    terms = []
+    if not use_regex and '|' in search_query:
+        terms = sorted({t.strip() for t in search_query.split('|') if t.strip()}, key=len, reverse=True)
+    
+    try:
+        if terms:
+            alternation = '|'.join(re.escape(t) for t in terms)
+            compiled = _get_pattern(alternation, case_sensitive, whole_word, True)
+        else:
+            compiled = _get_pattern(search_query, case_sensitive, whole_word, use_regex)
+    except re.error as e:
+        return [], 0, f"Invalid search pattern: {e}"
+    
+    automaton = None
+    if terms and ahocorasick is not None:
+        keywords = {t if case_sensitive else t.lower() for t in terms}
+        automaton = _get_automaton(tuple(sorted(keywords)))
+    
+    hs_db = None
+    if use_regex and hyperscan is not None:
+        # Whole-word matches are matches of the bare pattern too
+        hs_db = _get_hyperscan_db(search_query, case_sensitive)
+    
+    literal = not (use_regex or whole_word or terms)
+    needle = search_query if case_sensitive else search_query.lower()
+    
+    # Case-insensitive whole-word lookups of a single word use the word index
+    use_index = whole_word and not (use_regex or terms or case_sensitive) and _WORD_RE.fullmatch(search_query) is not None
+    
+    def find_spans(filename: str, doc: Dict) -> Iterator[Tuple[int, int]]:
+        """Pick the fastest scanner that applies to this document."""
         content = doc['content']
-        
-        try:
-            if case_sensitive:
-                search_text = search_query
-                content_search = content
-            else:
-                search_text = search_query.lower()
-                content_search = content.lower()
-            
-            if whole_word:
-                pattern = r'(?<!\w)' + re.escape(search_text) + r'(?!\w)'
-            else:
-                pattern = re.escape(search_text)
-            
-            flags = 0 if case_sensitive else re.IGNORECASE
-            matches = list(re.finditer(pattern, content_search, flags))
-            
-            if matches:
-                file_matches = []
-                for match in matches:
-                    match_start = match.start()
-                    match_end = match.end()
-                    exact_match = content[match_start:match_end]
-                    
-                    if show_context:
-                        context_start = max(0, match_start - context_chars)
-                        context_end = min(len(content), match_end + context_chars)
-                        context = content[context_start:context_end]
-                        
-                        match_in_context = match_start - context_start
-                        highlighted = (
-                            context[:match_in_context] +
-                            "**" + context[match_in_context:match_in_context+len(exact_match)] + "**" +
-                            context[match_in_context+len(exact_match):]
-                        )
-                        context_display = highlighted
-                    else:
-                        context_display = exact_match
-                    
-                    line_num = content[:match_start].count('\n') + 1
-                    lines = content.split('\n')
-                    line_text = lines[line_num-1] if line_num <= len(lines) else ""
-                    
-                    file_matches.append({
-                        'position': match_start,
-                        'line': line_num,
-                        'line_text': line_text,
-                        'exact_match': exact_match,
-                        'context': context_display,
-                        'match_length': len(exact_match)
-                    })
-                
-                all_results.append({
-                    'filename': filename,
-                    'file_type': doc['type'],
-                    'matches': file_matches,
-                    'match_count': len(file_matches)
-                })
-                total_matches += len(file_matches)
-                
-        except re.error as e:
-            return [], 0, f"Invalid search pattern: {e}"
-        except Exception:
-            return [], 0, "Search error occurred"
+        haystack = content if case_sensitive else doc['content_lower']
+        if use_index:
+            starts = _word_postings(hash(content), content).get(needle, ())
+            return ((start, _WORD_RE.match(content, start).end()) for start in starts)
+        if automaton is not None:
+            if len(haystack) == len(content):
+                return _scan_keywords(haystack, content, automaton, whole_word)
+        elif literal:
+            if len(haystack) == len(content):
+                return _scan_literal(haystack, needle)
+        elif hs_db is not None and doc['content_bytes'] is not None:
+            # Hyperscan only skips documents; re still finds the matches
+            if not _hyperscan_matches(doc['content_bytes'], hs_db):
+                return iter(())
+        return _scan_regex(content, compiled)
+    
+    try:
+        for filename, doc in _documents.items():
+            result = _search_one_file(filename, doc, find_spans(filename, doc), show_context, context_chars, count_all)
+            if result:
+                all_results.append(result)
+                total_matches += result['match_count']
+    except Exception:
+        return [], 0, "Search error occurred"
     
     return all_results, total_matches, ""
 
+# Cached corpus analytics
+@st.cache_data(show_spinner=False)
+def compute_totals(corpus_key: Tuple, _documents: Dict[str, Dict]) -> Dict[str, int]:
+    """Sum character, word and line counts across the corpus."""
+    return {
+        'chars': sum(d['size'] for d in _documents.values()),
+        'words': sum(d['words'] for d in _documents.values()),
+        'lines': sum(d['lines'] for d in _documents.values())
+    }
+
+@st.cache_data(show_spinner=False)
+def compute_word_freq(corpus_key: Tuple, _documents: Dict[str, Dict], top_n: int = 25) -> Tuple[List[Tuple[str, int]], int]:
+    """Return the most common tokens in the corpus and the total token count."""
+    word_freq = Counter()
+    for doc in _documents.values():
+        word_freq.update(doc['token_counter'])
+    return word_freq.most_common(top_n), sum(word_freq.values())
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def compute_vocabulary(corpus_key: Tuple, _documents: Dict[str, Dict]) -> List[str]:
+    """Return the sorted distinct tokens of the corpus."""
+    vocabulary = set()
+    for doc in _documents.values():
+        vocabulary.update(doc['token_counter'])
+    return sorted(vocabulary)
+
+# Prefix suggestions: a range of the sorted vocabulary
+def suggest_terms(vocabulary: List[str], prefix: str, limit: int = 5) -> List[str]:
+    """Return up to limit vocabulary tokens that extend prefix."""
+    suggestions = []
+    for i in range(bisect_left(vocabulary, prefix), len(vocabulary)):
+        word = vocabulary[i]
+        if not word.startswith(prefix) or len(suggestions) == limit:
+            break
+        if word != prefix:
+            suggestions.append(word)
+    return suggestions
+
+# Download report, rendered once per search and query text
+@st.cache_data(max_entries=8, show_spinner=False)
+def _render_report(query: str, search_key: Tuple, _results: List[Dict], total_matches: int) -> str:
+    """Render search results as the plain-text download report.
+    
+    search_key identifies the search that produced _results; only the
+    key is hashed by the cache.
+    """
+    uncounted = any(_is_uncounted(r) for r in _results)
+    
+    buf = StringIO()
+    w = buf.write
+    w("AI Document Search Results\n")
+    w(f"Query: '{query}'\n")
+    w(f"Total matches: {total_matches}{'+' if uncounted else ''}\n")
+    w(f"Files searched: {len(_results)}\n")
+    w("="*60 + "\n\n")
+    
+    for result in _results:
+        w(f"\n📄 File: {result['filename']}\n")
+        if result['truncated']:
+            more = "+" if _is_uncounted(result) else ""
+            w(f"📊 Matches: {result['match_count']}{more} (first {len(result['matches'])} of {result['match_count']}{more} listed)\n")
+        else:
+            w(f"📊 Matches: {result['match_count']}\n")
+        w("-"*40 + "\n")
+        
+        for match in result['matches']:
+            w(f"\n📍 Line {match['line']}, Position {match['position']}:\n")
+            w(f"🔍 Exact: {match['exact_match']}\n")
+            w(f"📝 Context: ...{match['context']}...\n")
+            w(f"📏 Length: {match['match_length']} chars\n")
+    
+    return buf.getvalue()
+
+# Viewer: line-numbered text, built once per document
+@st.cache_resource(max_entries=8, show_spinner=False)
+def _numbered_view(doc_key: Tuple, _lines: List[str]) -> str:
+    """Prefix every line with its 1-based line number."""
+    return "\n".join(f"{i:6d} | {line}" for i, line in enumerate(_lines, 1))
+
+# Fragments: st.fragment from Streamlit 1.37, experimental since 1.33
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
 # Main tabs
 tab1, tab2, tab3, tab4 = st.tabs(["📁 Upload", "🔍 AI Search", "📊 Analytics", "📖 Viewer"])
 
@@ -292,13 +694,47 @@ with tab1:
     
     if uploaded_files:
         if st.button("🚀 Process Uploaded Files", type="primary"):
+            # Files already loaded with identical content are not processed again
+            new_files = []
             for file in uploaded_files:
-                with st.spinner(f"Processing {file.name}..."):
-                    result = process_uploaded_file(file)
-                    if result:
-                        filename = sanitize_filename(file.name)
-                        st.session_state.documents[filename] = result
-                        st.success(f"✅ {filename} ({result['size']:,} chars)")
+                file_content = file.getvalue()
+                digest = hashlib.sha1(file_content).hexdigest()
+                filename = sanitize_filename(file.name)
+                loaded = st.session_state.documents.get(filename)
+                if loaded is not None and loaded.get('sha1') == digest:
+                    st.info(f"⏭️ {file.name} is already loaded")
+                else:
+                    validation = validate_file_content(file_content, filename)
+                    new_files.append((filename, file_content, digest, validation))
+            
+            # Valid PDFs not extracted before are parsed in parallel, one worker process each
+            pdf_jobs = {
+                digest: file_content for filename, file_content, digest, validation in new_files
+                if filename.lower().endswith('.pdf')
+                and _cached_pdf_text(digest) is None
+                and validation[0]
+            }
+            pool = None
+            pending = {}
+            if pypdf is not None and len(pdf_jobs) > 1:
+                pool = ProcessPoolExecutor(
+                    max_workers=min(len(pdf_jobs), os.cpu_count() or 1),
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                pending = submit_pdf_texts(pool, pdf_jobs)
+            
+            try:
+                for filename, file_content, digest, validation in new_files:
+                    with st.spinner(f"Processing {filename}..."):
+                        result = process_uploaded_file(
+                            filename, file_content, digest, validation, pending.get(digest)
+                        )
+                        if result:
+                            st.session_state.documents[filename] = result
+                            st.success(f"✅ {filename} ({result['size']:,} chars)")
+            finally:
+                if pool is not None:
+                    pool.shutdown()
     
     if st.session_state.documents:
         st.subheader("📋 Loaded Documents")
@@ -313,8 +749,29 @@ with tab1:
                     del st.session_state.documents[filename]
                     st.rerun()
 
-# Tab 2: Search
-with tab2:
+# Recent searches: fill the search box before it is drawn again
+def _set_search_query(query: str) -> None:
+    """Button callback that sets the main search box to query."""
+    st.session_state.main_search = query
+
+# Recent searches as one query: literal terms in regex mode, keywords otherwise
+def _recent_terms_query(history: OrderedDict, use_regex: bool) -> str:
+    """Join recent queries, newest first, into the longest query that fits MAX_QUERY_LENGTH."""
+    separator = '|' if use_regex else ' | '
+    parts = []
+    length = 0
+    for query in reversed(history):
+        term = re.escape(query) if use_regex else query
+        length += len(term) + (len(separator) if parts else 0)
+        if parts and length > MAX_QUERY_LENGTH:
+            break
+        parts.append(term)
+    return separator.join(parts)
+
+# Tab 2: Search, rerun on its own when its widgets change
+@_fragment
+def _search_tab():
+    """Render the search box, options, results and history."""
     st.header("🔍 AI-Powered Document Search")
     st.markdown("**Local RAG System**: Search across all documents with AI-enhanced capabilities (local processing).")
     
@@ -328,20 +785,35 @@ with tab2:
                 placeholder="Search for keywords, phrases, or concepts...",
                 key="main_search"
             )
+            last_term = re.split(r'[\s|]+', search_query.strip())[-1].lower() if search_query else ""
+            if last_term and not st.session_state.get("use_regex", False):
+                vocabulary = compute_vocabulary(_corpus_key(st.session_state.documents), st.session_state.documents)
+                suggestions = suggest_terms(vocabulary, last_term)
+                if suggestions:
+                    st.caption("Suggestions: " + ", ".join(f"`{word}`" for word in suggestions))
         with col2:
             st.write("")
             st.write("")
             if st.button("🔍 Search", type="primary", use_container_width=True):
                 if search_query:
                     selected_files = list(st.session_state.documents.keys())
-                    
-                    results, total_matches, error = perform_search_enhanced(
+                    search_docs = {name: st.session_state.documents[name] for name in selected_files}
+                    search_key = (
                         search_query,
-                        selected_files,
+                        _corpus_key(search_docs),
                         case_sensitive,
                         whole_word,
                         show_context,
-                        context_chars
+                        context_chars,
+                        st.session_state.get("use_regex", False),
+                        count_all
+                    )
+                    
+                    results, total_matches, error = perform_search_enhanced(
+                        search_query,
+                        search_key[1],
+                        search_docs,
+                        *search_key[2:]
                     )
                     
                     if error:
@@ -349,73 +821,74 @@ with tab2:
                     else:
                         st.session_state.search_results = results
                         st.session_state.total_matches = total_matches
+                        st.session_state.search_key = search_key
                         
-                        if search_query not in st.session_state.search_history:
-                            st.session_state.search_history.insert(0, search_query)
-                            if len(st.session_state.search_history) > 10:
-                                st.session_state.search_history = st.session_state.search_history[:10]
+                        history = st.session_state.search_history
+                        history[search_query] = None
+                        history.move_to_end(search_query)
+                        if len(history) > 10:
+                            history.popitem(last=False)
         
         with st.expander("⚙️ Advanced Search Options"):
-            use_regex = st.checkbox("Use regular expressions", value=False)
+            st.checkbox("Use regular expressions", value=False, key="use_regex")
             st.caption("Example: `^Chapter\\s+\\d+` for chapter headings")
+            st.caption("Without regular expressions, separate keywords with `|` to find any of them")
             
-            search_in = st.multiselect(
+            st.multiselect(
                 "Search in specific files:",
                 options=list(st.session_state.documents.keys()),
                 default=list(st.session_state.documents.keys())
             )
         
         if st.session_state.search_results and st.session_state.total_matches > 0:
-            st.success(f"✅ Found **{st.session_state.total_matches} matches** across **{len(st.session_state.search_results)} files**")
+            uncounted = any(_is_uncounted(r) for r in st.session_state.search_results)
+            more = "+" if uncounted else ""
+            st.success(f"✅ Found **{st.session_state.total_matches}{more} matches** across **{len(st.session_state.search_results)} files**")
             
             verified_count = sum(r['match_count'] for r in st.session_state.search_results)
-            st.info(f"📊 Showing **ALL {verified_count} matches** (complete results verified)")
+            if uncounted:
+                st.info(f"📊 Keeping the first **{MAX_MATCHES_PER_FILE} matches** per file (enable *Count all matches* for exact totals)")
+            elif any(r['truncated'] for r in st.session_state.search_results):
+                st.info(f"📊 Listing the first **{MAX_MATCHES_PER_FILE} matches** per file (totals count every match)")
+            else:
+                st.info(f"📊 Showing **ALL {verified_count} matches** (complete results verified)")
             
             for result in st.session_state.search_results:
-                with st.expander(f"📄 {result['filename']} - {result['match_count']} matches", expanded=True):
-                    for i, match in enumerate(result['matches'][:100]):
-                        col1, col2 = st.columns([1, 4])
-                        with col1:
-                            st.write(f"**#{i+1}**")
-                            st.caption(f"Line {match['line']}")
-                            st.caption(f"Char {match['position']:,}")
-                        with col2:
-                            if '**' in match['context']:
-                                st.markdown(f"...{match['context']}...")
-                            else:
-                                st.text(f"...{match['context']}...")
-                        
-                        with st.expander(f"Match details #{i+1}", expanded=False):
-                            st.write("**Exact text found:**")
-                            st.code(match['exact_match'])
-                            st.write(f"**Full line {match['line']}:**")
-                            st.text(match['line_text'])
-                            st.write(f"**Position:** Character {match['position']:,}")
-                            st.write(f"**Match length:** {match['match_length']} characters")
-                        
-                        if i < len(result['matches'][:100]) - 1:
-                            st.divider()
+                more = "+" if _is_uncounted(result) else ""
+                with st.expander(f"📄 {result['filename']} - {result['match_count']}{more} matches", expanded=True):
+                    shown = result['matches'][:100]
+                    md_blocks = [
+                        f"**#{i+1}** · Line {match['line']} · Char {match['position']:,}\n\n...{_context_markdown(match)}..."
+                        for i, match in enumerate(shown)
+                    ]
+                    st.markdown("\n\n---\n\n".join(md_blocks))
+                    
+                    detail_idx = st.selectbox(
+                        "Match details:",
+                        range(len(shown)),
+                        index=None,
+                        format_func=lambda i, shown=shown: f"#{i+1} - Line {shown[i]['line']}",
+                        placeholder="Choose a match to inspect...",
+                        key=f"details_{result['filename']}"
+                    )
+                    if detail_idx is not None:
+                        match = shown[detail_idx]
+                        st.write("**Exact text found:**")
+                        st.code(match['exact_match'])
+                        st.write(f"**Full line {match['line']}:**")
+                        st.text(match['line_text'])
+                        st.write(f"**Position:** Character {match['position']:,}")
+                        st.write(f"**Match length:** {match['match_length']} characters")
                     
                     if result['match_count'] > 100:
-                        st.info(f"📋 ...and {result['match_count'] - 100} more matches")
+                        st.info(f"📋 ...and {result['match_count'] - 100}{more} more matches")
             
-            results_text = f"AI Document Search Results\n"
-            results_text += f"Query: '{search_query}'\n"
-            results_text += f"Total matches: {st.session_state.total_matches}\n"
-            results_text += f"Files searched: {len(st.session_state.search_results)}\n"
-            results_text += "="*60 + "\n\n"
-            
-            for result in st.session_state.search_results:
-                results_text += f"\n📄 File: {result['filename']}\n"
-                results_text += f"📊 Matches: {result['match_count']}\n"
-                results_text += "-"*40 + "\n"
-                
-                for match in result['matches']:
-                    results_text += f"\n📍 Line {match['line']}, Position {match['position']}:\n"
-                    results_text += f"🔍 Exact: {match['exact_match']}\n"
-                    clean_context = match['context'].replace('**', '')
-                    results_text += f"📝 Context: ...{clean_context}...\n"
-                    results_text += f"📏 Length: {match['match_length']} chars\n"
+            results_text = _render_report(
+                search_query,
+                st.session_state.search_key,
+                st.session_state.search_results,
+                st.session_state.total_matches
+            )
             
             st.download_button(
                 "💾 Download All Results",
@@ -426,10 +899,21 @@ with tab2:
         
         if st.session_state.search_history:
             with st.expander("📜 Recent Searches"):
-                for query in st.session_state.search_history[:5]:
-                    if st.button(f"🔎 '{query}'", key=f"recent_{query}"):
-                        st.session_state.main_search = query
-                        st.rerun()
+                if len(st.session_state.search_history) > 1:
+                    # One multi-keyword pass finds every recent term at once
+                    st.button(
+                        "🔎 Search all recent terms",
+                        key="recent_all",
+                        on_click=_set_search_query,
+                        args=(_recent_terms_query(
+                            st.session_state.search_history, st.session_state.get("use_regex", False)
+                        ),)
+                    )
+                for query in islice(reversed(st.session_state.search_history), 5):
+                    st.button(f"🔎 '{query}'", key=f"recent_{query}", on_click=_set_search_query, args=(query,))
+
+with tab2:
+    _search_tab()
 
 # Tab 3: Analytics
 with tab3:
@@ -439,10 +923,12 @@ with tab3:
     if not st.session_state.documents:
         st.info("👆 Upload documents to see analytics")
     else:
+        corpus_key = _corpus_key(st.session_state.documents)
+        totals = compute_totals(corpus_key, st.session_state.documents)
         total_files = len(st.session_state.documents)
-        total_chars = sum(d['size'] for d in st.session_state.documents.values())
-        total_words = sum(d['words'] for d in st.session_state.documents.values())
-        total_lines = sum(d['lines'] for d in st.session_state.documents.values())
+        total_chars = totals['chars']
+        total_words = totals['words']
+        total_lines = totals['lines']
         
         col1, col2, col3, col4 = st.columns(4)
         with col1:
@@ -456,29 +942,22 @@ with tab3:
         
         st.subheader("🔤 AI Word Frequency Analysis")
         
-        from collections import Counter
-        all_words = []
-        for doc in st.session_state.documents.values():
-            words = re.findall(r'\b[\w\'-]+\b', doc['content'].lower())
-            all_words.extend(words)
+        top_words, total_tokens = compute_word_freq(corpus_key, st.session_state.documents)
         
-        if all_words:
-            word_freq = Counter(all_words)
-            top_words = word_freq.most_common(25)
+        if total_tokens:
             
             col1, col2 = st.columns(2)
             with col1:
                 st.write("**Top 25 Keywords:**")
                 for word, freq in top_words:
-                    percentage = (freq / len(all_words)) * 100
+                    percentage = (freq / total_tokens) * 100
                     st.write(f"`{word}`: {freq:,} ({percentage:.1f}%)")
             
             with col2:
-                try:
-                    import pandas as pd
+                if pd is not None:
                     df = pd.DataFrame(top_words[:15], columns=['Keyword', 'Frequency'])
                     st.bar_chart(df.set_index('Keyword'))
-                except ImportError:
+                else:
                     st.info("✨ Tip: Install pandas for enhanced visualizations")
         
         st.subheader("📦 Document Size Comparison")
@@ -503,8 +982,10 @@ with tab3:
                 if max_size > 0:
                     st.progress(min(doc['size'] / max_size, 1.0))
 
-# Tab 4: Viewer
-with tab4:
+# Tab 4: Viewer, rerun on its own when its widgets change
+@_fragment
+def _viewer_tab():
+    """Render the selected document in the chosen view mode."""
     st.header("📖 AI Document Viewer")
     st.markdown("**Interactive Knowledge Base**: View and analyze individual documents with AI-powered insights.")
     
@@ -545,10 +1026,7 @@ with tab4:
                     key="full_text_area"
                 )
             elif view_mode == "🔢 With Line Numbers":
-                lines = doc['content'].split('\n')
-                numbered = ""
-                for i, line in enumerate(lines, 1):
-                    numbered += f"{i:6d} | {line}\n"
+                numbered = _numbered_view(_corpus_key({selected_file: doc}), doc['lines_list'])
                 st.text_area(
                     "Document with Line Numbers:",
                     numbered,
@@ -556,7 +1034,7 @@ with tab4:
                     key="numbered_text_area"
                 )
             else:
-                lines = doc['content'].split('\n')
+                lines = doc['lines_list']
                 lines_per_page = st.slider("Lines per page", 50, 200, 100)
                 total_pages = max(1, (len(lines) + lines_per_page - 1) // lines_per_page)
                 
@@ -579,6 +1057,9 @@ with tab4:
                 "text/plain"
             )
 
+with tab4:
+    _viewer_tab()
+
 # Footer
 st.divider()
 st.markdown("""
@@ -0,0 +1,67 @@
+"""
+PDF text extraction for AI Document Search Pro.
+Kept apart from app.py so worker processes can import it without running the app.
+"""
+
+import sys
+import types
+from concurrent.futures import Future, ProcessPoolExecutor
+from io import BytesIO
+from typing import Dict, Iterator
+
+# PDF support, resolved once per process
+try:
+    import pypdf
+except ImportError:
+    try:
+        import PyPDF2 as pypdf
+    except ImportError:
+        pypdf = None
+
+# Scanned pages: images but no fonts, so there is no text to extract
+def _looks_image_only(page) -> bool:
+    """Cheaply tell from a page's resources that it only draws images."""
+    try:
+        resources = page.get('/Resources')
+        if resources is None:
+            return False  # inherited resources; let extraction decide
+        resources = resources.get_object()
+        if '/Font' in resources:
+            return False
+        xobjects = resources.get('/XObject')
+        if xobjects is None:
+            return False
+        xobjects = xobjects.get_object()
+        # Form XObjects can carry their own fonts and text
+        return len(xobjects) > 0 and all(
+            xobj.get_object().get('/Subtype') == '/Image' for xobj in xobjects.values()
+        )
+    except Exception:
+        return False
+
+# Lazy page-by-page PDF text extraction
+def iter_pdf_pages(pdf_reader) -> Iterator[str]:
+    """Yield the text of each PDF page that has any, one page at a time."""
+    for page in pdf_reader.pages:
+        if _looks_image_only(page):
+            continue
+        text = page.extract_text()
+        if text:
+            yield text
+
+def read_pdf_text(file_content: bytes) -> str:
+    """Extract the text of a PDF from its raw bytes."""
+    pdf_reader = pypdf.PdfReader(BytesIO(file_content))
+    return "\n\n".join(iter_pdf_pages(pdf_reader))
+
+# Parallel extraction in spawned worker processes
+def submit_pdf_texts(pool: ProcessPoolExecutor, contents: Dict[str, bytes]) -> Dict[str, Future]:
+    """Submit read_pdf_text for every PDF in contents, returning futures under the same keys."""
+    # A spawned worker first re-runs the parent's __main__ file, which under
+    # Streamlit is the whole app; workers start inside submit(), so hide it
+    main = sys.modules['__main__']
+    sys.modules['__main__'] = types.ModuleType('__main__')
+    try:
+        return {key: pool.submit(read_pdf_text, content) for key, content in contents.items()}
+    finally:
+        sys.modules['__main__'] = main
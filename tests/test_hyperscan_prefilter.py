@@ -0,0 +1,67 @@
+"""Differential tests: the Hyperscan prefilter must never rule out a document re would match."""
+
+import random
+import re
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("hyperscan")
+pytestmark = pytest.mark.filterwarnings("ignore::FutureWarning")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app  # noqa: E402
+
+
+def prefilter_keeps(pattern, text, case_sensitive):
+    """True unless the prefilter would skip a document with this text."""
+    doc = app._build_document(text.encode('utf-8'), False, "0")
+    db = app._get_hyperscan_db(pattern, case_sensitive)
+    if db is None or doc['content_bytes'] is None:
+        return True  # the prefilter is not used
+    return app._hyperscan_matches(doc['content_bytes'], db)
+
+
+def regex_finds(pattern, text, case_sensitive):
+    return re.search(pattern, text, 0 if case_sensitive else re.IGNORECASE) is not None
+
+
+@pytest.mark.parametrize("pattern, text, case_sensitive", [
+    (r"a\sb", "a\x1cb", True),
+    (r"a[\s]b", "a\x1fb", True),
+    ("K", "k", False),  # Kelvin sign folds to k
+    ("ſ", "s", False),  # long s folds to s
+    ("ı", "i", False),  # dotless i folds to i
+    (r"[[:alpha:]]", "[]", True),
+    (r"a{,2}b", "aab", True),
+    (r"a", "a", True),
+    (r"c$", "abc\n", True),
+])
+def test_known_cases(pattern, text, case_sensitive):
+    assert regex_finds(pattern, text, case_sensitive)
+    assert prefilter_keeps(pattern, text, case_sensitive)
+
+
+ATOMS = [
+    "a", "b", "A", "ab", "a|ab", "a+?", "a*", "(ab)*", "[ab]", "[^a]", "\\w", "\\W", "\\s", "\\S",
+    "[\\s]", "[^\\s]", "\\d", "\\b", "\\B", ".", "b?", "x{2}", "a{1,2}", "a{,2}", "^", "$", "\\A", "\\Z",
+    "(?i)", "(?m)", "(?s)", "[[:alpha:]]", "\\x41", "\\u0061", "\\101", "-", "\\.", "\\n",
+]
+ALPHABET = "abAB1 _-.\n\t\x0b\x0c\r\x1c\x1d\x1e\x1f[]:"
+
+
+def test_random_against_re():
+    rnd = random.Random(0)
+    for _ in range(20000):
+        pattern = ''.join(rnd.choice(ATOMS) for _ in range(rnd.randint(1, 3)))
+        text = ''.join(rnd.choice(ALPHABET) for _ in range(rnd.randint(0, 30)))
+        if not text.strip():
+            continue  # blank uploads are rejected before any search
+        case_sensitive = rnd.random() < 0.5
+        try:
+            found = regex_finds(pattern, text, case_sensitive)
+        except re.error:
+            continue
+        if found:
+            assert prefilter_keeps(pattern, text, case_sensitive), (pattern, text, case_sensitive)
@@ -0,0 +1,51 @@
+"""Differential tests: the Aho-Corasick keyword scanner against the regex alternation."""
+
+import random
+import re
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("ahocorasick")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app  # noqa: E402
+
+
+def keyword_spans(terms, text, case_sensitive, whole_word):
+    keywords = {t if case_sensitive else t.lower() for t in terms}
+    automaton = app._get_automaton(tuple(sorted(keywords)))
+    haystack = text if case_sensitive else text.lower()
+    return list(app._scan_keywords(haystack, text, automaton, whole_word))
+
+
+def regex_spans(terms, text, case_sensitive, whole_word):
+    ordered = sorted(terms, key=len, reverse=True)
+    alternation = '|'.join(re.escape(t) for t in ordered)
+    pattern = app._get_pattern(alternation, case_sensitive, whole_word, True)
+    return [m.span() for m in pattern.finditer(text)]
+
+
+@pytest.mark.parametrize("terms, text, whole_word", [
+    (["heath", "eat"], "we eat in the heat", False),
+    (["data", "at"], "look at the dat", False),
+    (["foo bar", "bar"], "xfoo bar", True),
+])
+def test_known_cases(terms, text, whole_word):
+    assert keyword_spans(terms, text, False, whole_word) == regex_spans(terms, text, False, whole_word)
+
+
+def test_random_against_alternation():
+    rnd = random.Random(0)
+    for _ in range(5000):
+        alphabet = rnd.choice(["ab ", "abc_ ", "aAb ", "ab1-"])
+        terms = {
+            ''.join(rnd.choice(alphabet) for _ in range(rnd.randint(1, 4))).strip() or 'a'
+            for _ in range(rnd.randint(1, 4))
+        }
+        text = ''.join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 40)))
+        case_sensitive = rnd.random() < 0.5
+        whole_word = rnd.random() < 0.5
+        assert keyword_spans(terms, text, case_sensitive, whole_word) == \
+            regex_spans(terms, text, case_sensitive, whole_word), (terms, text, case_sensitive, whole_word)